@@ -5,6 +5,7 @@ A tiny local HTTP server that:
 - Serves a simple web UI with drag-and-drop and progress,
 - Uses a session-based, chunked upload over multiple small POSTs (no streaming body),
 - Forwards all bytes over a single, real TCP socket to the TCP file server (tcp_file_server.py).
+  On Linux the chunk bodies are spliced socket-to-socket in the kernel (zero-copy).
 
 Endpoints:
 - POST /begin?host=IP&port=PORT    (headers: X-Filename, X-Filesize)
@@ -25,19 +26,79 @@ This version avoids streaming request bodies, so it works reliably on Chrome/Win
 Only Python standard library is used.
 """
 
+import gzip
 import json
+import hashlib
 import socket
 import secrets
 import threading
+import time
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import urlparse, parse_qs, unquote
-
-from shared import HEADER_LEN_SIZE, CHUNK_SIZE, pack_length, unpack_length
-
-# In-memory session store: session_id -> dict
+from urllib.parse import urlparse, unquote, unquote_plus
+
+from shared import (
+    SPLICE_AVAILABLE,
+    IDLE_TIMEOUT,
+    DONE_TIMEOUT,
+    ProgressLogger,
+    send_json,
+    recv_json,
+    splice_copy,
+    tune_socket,
+    WorkerPool,
+)
+
+
+class Session:
+    """
+    State of one upload: the TCP connection to the receiver and how far we got.
+    __slots__ gives fixed attributes (faster to access than dict keys, and smaller).
+    """
+
+    __slots__ = ("conn", "filesize", "received", "save_as", "progress", "lock", "buffer", "last_active")
+
+    def __init__(self, conn: socket.socket, filesize: int, save_as: str):
+        self.conn = conn
+        self.filesize = filesize
+        self.received = 0
+        self.save_as = save_as
+        self.progress = ProgressLogger("[HTTP->TCP] Forwarding", filesize)
+        self.lock = threading.Lock()  # keeps one upload's chunks in order
+        self.buffer = None  # forwarding buffer, created on first use and reused
+        self.last_active = time.monotonic()  # when a chunk last arrived (see reap_idle_sessions)
+
+
+# In-memory session store: session_id -> Session
 SESSIONS = {}
 SESSIONS_LOCK = threading.Lock()
 
+
+def reap_idle_sessions():
+    """
+    Background thread: close sessions that got no chunk for IDLE_TIMEOUT seconds
+    (closed tab, abandoned upload), so their TCP connection doesn't stay open forever.
+    """
+    while True:
+        time.sleep(IDLE_TIMEOUT / 10)
+        cutoff = time.monotonic() - IDLE_TIMEOUT
+        with SESSIONS_LOCK:
+            idle = [(sid, sess) for sid, sess in SESSIONS.items() if sess.last_active < cutoff]
+        for sid, sess in idle:
+            if not sess.lock.acquire(blocking=False):
+                continue  # a chunk is being forwarded right now: not idle after all
+            try:
+                with SESSIONS_LOCK:
+                    SESSIONS.pop(sid, None)
+                sess.conn.close()
+                print(f"[HTTP->TCP] Closed idle session {sid}")
+            finally:
+                sess.lock.release()
+
+
+# Largest buffer used to forward one chunk body when splice isn't available.
+# Matches the browser's biggest chunk (MAX_CHUNK_SIZE below), so a chunk is one read + one send.
+MAX_FORWARD_BUFFER = 8 * 1024 * 1024
+
 INDEX_HTML = """<!doctype html>
 <html lang="en">
 <head>
@@ -174,7 +235,11 @@ INDEX_HTML = """<!doctype html>
   let sessionId = null;
   let bytesSent = 0;
   let totalBytes = 0;
-  const CHUNK_SIZE = 256 * 1024; // 256 KB per request for smooth progress
+  // Chunk size adapts to the link: bigger chunks mean fewer HTTP requests, smaller ones keep
+  // progress smooth and Pause/Cancel responsive. Each request aims to take about CHUNK_TARGET_MS.
+  const MIN_CHUNK_SIZE = 1024 * 1024;     // 1 MB
+  const MAX_CHUNK_SIZE = 8 * 1024 * 1024; // 8 MB
+  const CHUNK_TARGET_MS = 250;
 
   // Validation
   const MAX_SIZE = 2 * 1024 * 1024 * 1024; // 2GB
@@ -187,8 +252,15 @@ INDEX_HTML = """<!doctype html>
     barEl.style.width = Math.min(100, pct).toFixed(2) + '%';
     sentBytesEl.textContent = fmtBytes(n);
   }
+  // Repaint progress at most once per animation frame, however fast chunks complete
+  let progressFrame = 0;
+  function scheduleProgress() {
+    if (progressFrame) return;
+    progressFrame = requestAnimationFrame(() => { progressFrame = 0; setProgress(bytesSent, totalBytes); });
+  }
   function setTotal(n) { totalBytesEl.textContent = fmtBytes(n); }
   function resetProgress() {
+    if (progressFrame) { cancelAnimationFrame(progressFrame); progressFrame = 0; }
     setStatus('Idle'); setProgress(0, 1); sentBytesEl.textContent = '0'; totalBytesEl.textContent = '0'; barEl.style.width = '0%';
   }
 
@@ -261,6 +333,7 @@ INDEX_HTML = """<!doctype html>
       setStatus('Sending...');
 
       let offset = 0;
+      let chunkSize = MIN_CHUNK_SIZE;
       while (offset < currentFile.size) {
         if (canceled) throw new Error('Canceled');
         if (paused) {
@@ -268,13 +341,17 @@ INDEX_HTML = """<!doctype html>
           await new Promise(r => setTimeout(r, 100));
           continue;
         }
-        const end = Math.min(offset + CHUNK_SIZE, currentFile.size);
+        const end = Math.min(offset + chunkSize, currentFile.size);
         const chunk = currentFile.slice(offset, end);
+        const started = performance.now();
         await sendChunk(sessionId, chunk);
+        const took = performance.now() - started;
+        if (took < CHUNK_TARGET_MS / 2 && chunkSize < MAX_CHUNK_SIZE) chunkSize *= 2;
+        else if (took > CHUNK_TARGET_MS * 2 && chunkSize > MIN_CHUNK_SIZE) chunkSize /= 2;
         offset = end;
         bytesSent = offset;
         setStatus('Sending...');
-        setProgress(bytesSent, totalBytes);
+        scheduleProgress();
       }
 
       const done = await endSession(sessionId);
@@ -308,17 +385,61 @@ INDEX_HTML = """<!doctype html>
 </html>
 """
 
+# The page never changes while the server runs: encode and gzip it once, at import
+INDEX_BYTES = INDEX_HTML.encode("utf-8")
+INDEX_GZIP = gzip.compress(INDEX_BYTES, compresslevel=9)
+# Fingerprint of the page: a browser that already has this version gets "304 Not Modified"
+INDEX_ETAG = '"%s"' % hashlib.blake2b(INDEX_BYTES, digest_size=8).hexdigest()
+
+
+def query_param(query: str, key: str) -> str:
+    """
+    Return the value of 'key' in a query string like "id=abc&x=1" ("" if missing).
+    Our URLs carry one or two short parameters, so a single scan is enough;
+    parse_qs would build a dict of lists just for us to read one value.
+    """
+    for pair in query.split("&"):
+        name, _, value = pair.partition("=")
+        if name == key:
+            return unquote_plus(value)
+    return ""
+
+
 # ------------- HTTP Handler -------------
 
 class Handler(BaseHTTPRequestHandler):
+    # Buffer responses: status line, headers and JSON body then leave in one send()
+    # when the request finishes, instead of one for the headers and one for the body
+    wbufsize = 64 * 1024
+
+    # HTTP/1.1 keep-alive: the browser sends all /chunk POSTs of an upload over the same
+    # connection instead of a new TCP connection per chunk (every reply has Content-Length)
+    protocol_version = "HTTP/1.1"
+    # An idle kept-alive connection occupies a pool thread; close it after this many seconds
+    timeout = 15
+
     # Serve SPA
     def do_GET(self):
         if self.path == "/" or self.path.startswith("/index.html"):
+            # The browser's cached copy is still current: answer with headers only
+            if INDEX_ETAG in (self.headers.get("If-None-Match") or ""):
+                self.send_response(304)
+                self.send_header("ETag", INDEX_ETAG)
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return
+            # Send the pre-compressed page to browsers that accept gzip (all modern ones do)
+            use_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "").lower()
+            body = INDEX_GZIP if use_gzip else INDEX_BYTES
             self.send_response(200)
             self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.send_header("Connection", "close")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("ETag", INDEX_ETAG)
+            self.send_header("Content-Length", str(len(body)))
             self.end_headers()
-            self.wfile.write(INDEX_HTML.encode("utf-8"))
+            self.wfile.write(body)
             return
         self.send_response(404)
         self.send_header("Connection", "close")
@@ -340,9 +461,8 @@ class Handler(BaseHTTPRequestHandler):
     # --- Endpoint implementations ---
 
     def handle_begin(self, parsed):
-        q = parse_qs(parsed.query)
-        host = (q.get("host") or [""])[0]
-        port_str = (q.get("port") or [""])[0]
+        host = query_param(parsed.query, "host")
+        port_str = query_param(parsed.query, "port")
         try:
             port = int(port_str)
         except Exception:
@@ -365,14 +485,12 @@ class Handler(BaseHTTPRequestHandler):
 
         try:
             conn = socket.create_connection((host, port), timeout=10)
+            tune_socket(conn)
             # Send header to TCP server
-            header = {"filename": filename, "filesize": filesize}
-            body = json.dumps(header).encode("utf-8")
-            conn.sendall(pack_length(len(body)))
-            conn.sendall(body)
+            send_json(conn, {"filename": filename, "filesize": filesize})
 
             # Await OK
-            server_resp = self.recv_json(conn)
+            server_resp = recv_json(conn)
             if server_resp.get("status") != "OK":
                 msg = server_resp.get("message", "Server rejected the upload")
                 conn.close()
@@ -381,20 +499,14 @@ class Handler(BaseHTTPRequestHandler):
             save_as = server_resp.get("save_as") or filename
             session_id = secrets.token_hex(16)
             with SESSIONS_LOCK:
-                SESSIONS[session_id] = {
-                    "conn": conn,
-                    "filesize": filesize,
-                    "received": 0,
-                    "save_as": save_as,
-                }
+                SESSIONS[session_id] = Session(conn, filesize, save_as)
             return self.send_json(200, {"status": "OK", "session_id": session_id, "save_as": save_as})
 
         except Exception as e:
             return self.send_json(500, {"status": "ERROR", "message": str(e)})
 
     def handle_chunk(self, parsed):
-        q = parse_qs(parsed.query)
-        session_id = (q.get("id") or [""])[0]
+        session_id = query_param(parsed.query, "id")
         if not session_id:
             return self.send_json(400, {"status": "ERROR", "message": "Missing session id"})
 
@@ -408,49 +520,40 @@ class Handler(BaseHTTPRequestHandler):
             sess = SESSIONS.get(session_id)
         if not sess:
             return self.send_json(404, {"status": "ERROR", "message": "Invalid session"})
-        conn: socket.socket = sess["conn"]
-        filesize = sess["filesize"]
-        received = sess["received"]
-
-        remaining_total = filesize - received
-        if n > remaining_total:
-            return self.send_json(400, {"status": "ERROR", "message": "Chunk exceeds remaining bytes"})
+        # The session lock keeps chunks of one upload in order on the TCP stream and
+        # lets other sessions run in parallel (SESSIONS_LOCK only guards the dict itself)
+        with sess.lock:
+            conn: socket.socket = sess.conn
+            filesize = sess.filesize
+            received = sess.received
 
-        try:
-            to_forward = n
-            while to_forward > 0:
-                chunk = self.rfile.read(min(CHUNK_SIZE, to_forward))
-                if not chunk:
-                    raise ConnectionError("Unexpected EOF in chunk body")
-                conn.sendall(chunk)
-                to_forward -= len(chunk)
+            remaining_total = filesize - received
+            if n > remaining_total:
+                return self.send_json(400, {"status": "ERROR", "message": "Chunk exceeds remaining bytes"})
 
-            # Update session counters
-            with SESSIONS_LOCK:
-                sess["received"] += n
-                new_received = sess["received"]
-            remaining = filesize - new_received
-
-            # Log progress roughly each ~1MB
-            if new_received % (1024 * 1024) < CHUNK_SIZE:
-                pct = (new_received / filesize) * 100 if filesize else 100
-                print(f"[HTTP->TCP] Forwarding: {new_received}/{filesize} bytes ({pct:.2f}%)")
-
-            return self.send_json(200, {"status": "OK", "received": new_received, "remaining": remaining})
-
-        except Exception as e:
-            # On error, close and remove session to avoid dangling sockets
             try:
-                conn.close()
-            except Exception:
-                pass
-            with SESSIONS_LOCK:
-                SESSIONS.pop(session_id, None)
-            return self.send_json(500, {"status": "ERROR", "message": str(e)})
+                self._forward_body(conn, n, sess)
+
+                # Update session counters
+                sess.received = new_received = received + n
+                sess.last_active = time.monotonic()
+                remaining = filesize - new_received
+                sess.progress.update(new_received)
+
+                return self.send_json(200, {"status": "OK", "received": new_received, "remaining": remaining})
+
+            except Exception as e:
+                # On error, close and remove session to avoid dangling sockets
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                with SESSIONS_LOCK:
+                    SESSIONS.pop(session_id, None)
+                return self.send_json(500, {"status": "ERROR", "message": str(e)})
 
     def handle_end(self, parsed):
-        q = parse_qs(parsed.query)
-        session_id = (q.get("id") or [""])[0]
+        session_id = query_param(parsed.query, "id")
         if not session_id:
             return self.send_json(400, {"status": "ERROR", "message": "Missing session id"})
 
@@ -459,14 +562,15 @@ class Handler(BaseHTTPRequestHandler):
         if not sess:
             return self.send_json(404, {"status": "ERROR", "message": "Invalid session"})
 
-        conn: socket.socket = sess["conn"]
-        filesize = sess["filesize"]
-        received = sess["received"]
+        conn: socket.socket = sess.conn
+        filesize = sess.filesize
+        with sess.lock:  # wait for a chunk that may still be forwarding
+            received = sess.received
 
         if received != filesize:
             # Inform client but try to read any server error message
             try:
-                resp = self.recv_json(conn)
+                resp = recv_json(conn)
             except Exception:
                 resp = {"status": "ERROR", "message": "Size mismatch at end"}
             try:
@@ -478,8 +582,9 @@ class Handler(BaseHTTPRequestHandler):
             return self.send_json(400, {"status": "ERROR", "message": resp.get("message", "Size mismatch")})
 
         try:
-            # Await final DONE from TCP server
-            final_resp = self.recv_json(conn)
+            # Await final DONE from TCP server (it may be flushing the file to disk first)
+            conn.settimeout(DONE_TIMEOUT)
+            final_resp = recv_json(conn)
             status_code = 200 if final_resp.get("status") == "DONE" else 500
             payload = {
                 "status": final_resp.get("status", "ERROR"),
@@ -500,8 +605,7 @@ class Handler(BaseHTTPRequestHandler):
                 SESSIONS.pop(session_id, None)
 
     def handle_cancel(self, parsed):
-        q = parse_qs(parsed.query)
-        session_id = (q.get("id") or [""])[0]
+        session_id = query_param(parsed.query, "id")
         if not session_id:
             return self.send_json(400, {"status": "ERROR", "message": "Missing session id"})
         with SESSIONS_LOCK:
@@ -509,43 +613,84 @@ class Handler(BaseHTTPRequestHandler):
         if not sess:
             return self.send_json(200, {"status": "OK", "message": "No session"})
         try:
-            sess["conn"].close()
+            sess.conn.close()
         except Exception:
             pass
         return self.send_json(200, {"status": "OK", "message": "Canceled"})
 
     # --- Helpers ---
 
-    def recv_json(self, conn: socket.socket):
-        """Receive a framed JSON message (8-byte length + body) from TCP server."""
-        length_bytes = self._recv_exactly(conn, HEADER_LEN_SIZE)
-        length = unpack_length(length_bytes)
-        body = self._recv_exactly(conn, length)
-        return json.loads(body.decode("utf-8"))
-
-    def _recv_exactly(self, conn: socket.socket, n: int) -> bytes:
-        buf = b""
-        while len(buf) < n:
-            chunk = conn.recv(n - len(buf))
-            if not chunk:
-                raise ConnectionError("TCP server closed connection early")
-            buf += chunk
-        return buf
+    def _forward_body(self, conn: socket.socket, n: int, sess: Session):
+        """
+        Forward exactly n bytes of the request body to the TCP server.
+        On Linux the bytes are spliced from the browser socket to the TCP socket inside
+        the kernel; otherwise (or if splicing is refused) we read the body and sendall it.
+        """
+        to_forward = n
+        if SPLICE_AVAILABLE and to_forward > 0:
+            # The HTTP parser may already hold the start of the body in its buffer: send that first
+            head = self.rfile.read(min(len(self.rfile.peek(1)), to_forward))
+            if not head:
+                raise ConnectionError("Unexpected EOF in chunk body")
+            conn.sendall(head)
+            to_forward -= len(head)
+            to_forward -= splice_copy(self.connection.fileno(), conn.fileno(), to_forward, conn.gettimeout())
+
+        # Portable path: fill one buffer with the whole body (up to MAX_FORWARD_BUFFER),
+        # then hand it to the TCP socket with a single sendall.
+        # The buffer belongs to the session and is reused for every chunk (chunks of one
+        # session never overlap, the session lock is held), so no new allocation per POST.
+        if to_forward > 0:
+            want = min(to_forward, MAX_FORWARD_BUFFER)
+            view = sess.buffer
+            if view is None or len(view) < want:
+                view = sess.buffer = memoryview(bytearray(want))
+            while to_forward > 0:
+                filled = 0
+                size = min(len(view), to_forward)
+                while filled < size:
+                    got = self.rfile.readinto(view[filled:size])
+                    if not got:
+                        raise ConnectionError("Unexpected EOF in chunk body")
+                    filled += got
+                conn.sendall(view[:filled])
+                to_forward -= filled
 
     def send_json(self, status_code: int, data: dict):
         payload = json.dumps(data).encode("utf-8")
         self.send_response(status_code)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Content-Length", str(len(payload)))
-        self.send_header("Connection", "close")
+        if status_code >= 400:
+            # An error may leave (part of) the request body unread on the socket,
+            # so don't try to read another request from this connection
+            self.send_header("Connection", "close")
         self.end_headers()
         self.wfile.write(payload)
 
 
-def start_http_ui(host="127.0.0.1", port=8000):
+class PooledHTTPServer(ThreadingHTTPServer):
+    """
+    A ThreadingHTTPServer that hands connections to a pool of reusable worker threads,
+    instead of starting a new thread for every connection.
+    With keep-alive, an idle browser connection occupies its thread until Handler.timeout,
+    so the pool adds threads when all are busy (see WorkerPool), up to max_threads;
+    past that, new connections wait until a thread is free.
+    """
+
+    def __init__(self, server_address, handler_class, pool_size: int = 16, max_threads: int = 128):
+        super().__init__(server_address, handler_class)
+        self.pool = WorkerPool(self.process_request_thread, pool_size, max_threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(request, client_address)
+
+
+def start_http_ui(host="127.0.0.1", port=8000, pool_size=16, max_threads=128):
     print(f"HTTP Front-End running at http://{host}:{port}")
     print("Open the URL in your browser. Press Ctrl+C to stop.")
-    with ThreadingHTTPServer((host, port), Handler) as httpd:
+    threading.Thread(target=reap_idle_sessions, daemon=True).start()
+    with PooledHTTPServer((host, port), Handler, pool_size=pool_size, max_threads=max_threads) as httpd:
         httpd.serve_forever()
 
 
@@ -6,12 +6,60 @@ Only uses Python standard library to keep things simple for students.
 """
 
 import os
+import json
+import errno
+import mmap
+import select
+import socket
+import time
 import struct
+import queue
 import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl  # Unix only; used to enlarge the splice pipe
+except ImportError:
+    fcntl = None
 
 # Network protocol constants
 HEADER_LEN_SIZE = 8  # First 8 bytes tell how long the JSON header is
-CHUNK_SIZE = 64 * 1024  # 64KB chunks for streaming
+# Bytes moved per read/write in the transfer loops. Bigger chunks mean fewer syscalls and
+# fewer Python loop iterations per file. Override with the TRANSFER_CHUNK_SIZE env variable.
+CHUNK_SIZE = int(os.environ.get("TRANSFER_CHUNK_SIZE", 256 * 1024))  # 256KB by default
+# Round up to whole memory pages (usually 4 KB), so each read/write covers full pages
+CHUNK_SIZE = max(1, -(-CHUNK_SIZE // mmap.PAGESIZE)) * mmap.PAGESIZE
+
+# Console progress lines are printed at most this often (seconds) per transfer
+PROGRESS_LOG_INTERVAL = 1.0
+# Set to False (or TRANSFER_VERBOSE=0 in the environment) to turn progress lines off completely
+VERBOSE = os.environ.get("TRANSFER_VERBOSE", "1") != "0"
+
+# TCP tuning. By default the kernel sizes socket buffers itself ("autotuning"), growing them
+# as the link needs; setting a fixed size turns that off. 0 keeps autotuning (recommended);
+# set e.g. 4 * 1024 * 1024 to force a size (Linux caps it at net.core.rmem_max / wmem_max).
+# Can also be set per machine with the TRANSFER_SOCKET_BUFFER env variable (in bytes).
+SOCKET_BUFFER_SIZE = int(os.environ.get("TRANSFER_SOCKET_BUFFER", 0))
+# Keep at most this many not-yet-sent bytes queued in the kernel per socket, so the send
+# queue stays short while autotuning still grows the real TCP window
+NOTSENT_LOWAT = 128 * 1024
+
+# An upload that moves no data for this many seconds is abandoned (e.g. a tab was closed, or
+# a transfer stayed paused): the receiver drops the connection and the front-end its session,
+# so neither keeps a thread and socket busy forever
+IDLE_TIMEOUT = 5 * 60
+
+# How long a sender waits for the final DONE after the last byte. The receiver may first
+# flush the whole file to disk (TRANSFER_DURABILITY), which can take a while for big files.
+DONE_TIMEOUT = 10 * 60
+
+# Linux can move bytes between two file descriptors inside the kernel with splice(2).
+# Python exposes it as os.splice (3.10+). Elsewhere we use a normal read/write loop.
+SPLICE_AVAILABLE = hasattr(os, "splice")
+# Pipe capacity requested for splicing. A default pipe holds 64 KB, so every 64 KB would
+# cost two splice calls; a bigger pipe moves more per call (capped by fs.pipe-max-size).
+SPLICE_PIPE_SIZE = 1024 * 1024
 
 # Basic server-side validation (students can adjust as needed)
 MAX_FILE_SIZE_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB size limit example
@@ -19,53 +67,311 @@ MAX_FILE_SIZE_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB size limit example
 ALLOWED_EXTENSIONS = []  # e.g., ['.txt', '.png', '.jpg']
 
 
+# Precompiled struct for the 8-byte big-endian length prefix (format parsed once, at import)
+_LENGTH = struct.Struct('!Q')
+
+
 def pack_length(n: int) -> bytes:
     """
     Pack a Python int into 8 bytes (big-endian).
     The receiver uses this to know how big the JSON header is.
     """
-    return struct.pack('!Q', n)
+    return _LENGTH.pack(n)
 
 
 def unpack_length(b: bytes) -> int:
     """
     Unpack 8 bytes (big-endian) into a Python int.
     """
-    return struct.unpack('!Q', b)[0]
+    return _LENGTH.unpack_from(b)[0]
+
+
+def recv_exactly(conn: socket.socket, n: int) -> bytes:
+    """Receive exactly n bytes from the socket or raise if connection closes early."""
+    # One preallocated buffer filled in place, instead of "buf += chunk" copying it all each time
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = conn.recv_into(view[got:])
+        if not k:
+            raise ConnectionError("Connection closed while reading")
+        got += k
+    return bytes(buf)
+
+
+def send_json(conn: socket.socket, data: dict):
+    """Send JSON data framed by a 8-byte length header."""
+    body = json.dumps(data).encode("utf-8")
+    # One write for length + body: one syscall, and the tiny prefix never travels alone
+    conn.sendall(pack_length(len(body)) + body)
+
+
+def recv_json(conn: socket.socket) -> dict:
+    """Receive a framed JSON message (8-byte length + body)."""
+    length_bytes = recv_exactly(conn, HEADER_LEN_SIZE)
+    length = unpack_length(length_bytes)
+    body = recv_exactly(conn, length)
+    return json.loads(body)  # json accepts UTF-8 bytes directly, no separate decode step
+
+
+def tune_socket(sock: socket.socket):
+    """
+    Apply simple TCP tuning to a socket:
+    - TCP_NODELAY, so small JSON control messages are sent right away (no Nagle delay),
+    - SO_KEEPALIVE, so a peer that vanished (e.g. a closed browser tab mid-upload) is
+      eventually detected instead of leaving the connection open forever,
+    - TCP_NOTSENT_LOWAT (where available), so unsent data doesn't pile up in the kernel,
+    - fixed send/receive buffers only if SOCKET_BUFFER_SIZE is set, and never smaller
+      than what the OS already picked.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, NOTSENT_LOWAT)
+    if SOCKET_BUFFER_SIZE:
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            if sock.getsockopt(socket.SOL_SOCKET, option) < SOCKET_BUFFER_SIZE:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+
+
+class WorkerPool:
+    """
+    Runs handler(*job) for each submitted job on reusable threads.
+    'size' threads are started up front and kept forever. A transfer can hold its thread
+    for a long time (a big or paused upload), so when a job arrives and every thread is
+    busy, an extra thread is started instead of making the job wait in the queue.
+    Extra threads exit again after 'spare_idle' seconds without work.
+    There are never more than 'max_threads' threads (4 x size by default); beyond that,
+    jobs wait in the queue until a thread is free, so memory stays bounded.
+    """
+
+    def __init__(self, handler, size: int, max_threads: int = None, spare_idle: float = 30.0):
+        self.handler = handler
+        self.max_threads = max(size, max_threads or 4 * size)
+        self.spare_idle = spare_idle
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = size
+        # Threads waiting for a job minus jobs waiting in the queue (negative = backlog)
+        self.idle = size
+        for _ in range(size):
+            threading.Thread(target=self._run, args=(True,), daemon=True).start()
+
+    def submit(self, *job):
+        with self.lock:
+            if self.idle <= 0 and self.threads < self.max_threads:
+                try:
+                    threading.Thread(target=self._run, args=(False,), daemon=True).start()
+                except RuntimeError:
+                    pass  # the OS won't give us another thread: the job waits in the queue
+                else:
+                    self.threads += 1
+                    self.idle += 1
+            self.idle -= 1
+            self.jobs.put(job)
+
+    def _run(self, permanent: bool):
+        while True:
+            try:
+                job = self.jobs.get(timeout=None if permanent else self.spare_idle)
+            except queue.Empty:
+                with self.lock:
+                    if self.jobs.empty():  # no job was promised to us meanwhile: retire
+                        self.idle -= 1
+                        self.threads -= 1
+                        return
+                continue
+            try:
+                self.handler(*job)
+            finally:
+                with self.lock:
+                    self.idle += 1
+
+
+class ProgressLogger:
+    """
+    Prints progress of one transfer to the console, with the current speed.
+    Printing on every chunk would burn CPU in the hot loop, so a line is printed
+    at most once per PROGRESS_LOG_INTERVAL seconds, plus once when the transfer completes.
+    """
+
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.last_time = time.monotonic()
+        self.last_done = 0
+        self.next_log = self.last_time + PROGRESS_LOG_INTERVAL
+        self.speed = None  # bytes per second, smoothed
+
+    def update(self, done: int):
+        if not VERBOSE:
+            return
+        now = time.monotonic()
+        if now < self.next_log and done < self.total:
+            return
+        self.next_log = now + PROGRESS_LOG_INTERVAL
+
+        # Speed over the last interval, smoothed (moving average) so one slow moment
+        # doesn't make the number jump around
+        elapsed = now - self.last_time
+        if elapsed > 0:
+            current = (done - self.last_done) / elapsed
+            self.speed = current if self.speed is None else 0.8 * self.speed + 0.2 * current
+        self.last_time, self.last_done = now, done
+
+        pct = (done / self.total) * 100 if self.total else 100
+        speed = f" at {self.speed / (1024 * 1024):.2f} MB/s" if self.speed is not None else ""
+        print(f"{self.label}: {done}/{self.total} bytes ({pct:.2f}%){speed}")
+
 
+# Remembers the next " (N)" number to try for each duplicated name, so the 100th copy of
+# "photo.jpg" doesn't have to try " (1)" .. " (99)" again. Only a hint: O_EXCL decides.
+# Kept small: the least recently duplicated names are forgotten (they just probe from 1 again).
+SUFFIX_CACHE_SIZE = 1024
+_next_suffix = OrderedDict()
+_next_suffix_lock = threading.Lock()
 
-def unique_save_path(dest_dir: str, filename: str) -> tuple[str, bool]:
+
+def open_unique_file(dest_dir: str, filename: str) -> tuple[int, str, bool]:
     """
-    Returns a unique path for saving a file.
+    Creates and opens a new file for writing without overwriting anything.
     If a file with the same name exists, append ' (1)', ' (2)', ... before the extension.
-    - dest_dir: output directory
+    The file is created with O_EXCL, so the "does it exist?" check and the creation are
+    one atomic step: two clients sending the same name at once never get the same path.
+    - dest_dir: output directory (must already exist)
     - filename: requested file name (no path)
-    Returns (final_path, renamed_flag)
+    Returns (fd, final_path, renamed_flag)
     """
-    os.makedirs(dest_dir, exist_ok=True)
-    base, ext = os.path.splitext(filename)
-    candidate = os.path.join(dest_dir, filename)
-    counter = 1
-    renamed = False
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    first_choice = os.path.join(dest_dir, filename)
+    try:
+        return os.open(first_choice, flags, 0o644), first_choice, False
+    except FileExistsError:
+        pass
 
-    while os.path.exists(candidate):
+    base, ext = os.path.splitext(filename)
+    with _next_suffix_lock:
+        counter = _next_suffix.get(first_choice, 1)
+    while True:
         candidate = os.path.join(dest_dir, f"{base} ({counter}){ext}")
-        counter += 1
-        renamed = True
-
-    return candidate, renamed
+        try:
+            fd = os.open(candidate, flags, 0o644)
+        except FileExistsError:
+            counter += 1
+            continue
+        with _next_suffix_lock:
+            _next_suffix[first_choice] = max(_next_suffix.get(first_choice, 1), counter + 1)
+            _next_suffix.move_to_end(first_choice)
+            if len(_next_suffix) > SUFFIX_CACHE_SIZE:
+                _next_suffix.popitem(last=False)
+        return fd, candidate, True
 
 
 def compute_sha256_of_file(path: str) -> str:
     """
     Compute SHA-256 of a file to demonstrate simple integrity check.
     NOTE: This is optional for the demo and can be omitted to simplify.
+    On Python 3.11+ hashlib.file_digest does the whole read/hash loop in C.
+    Older versions map the file into memory and hash it with a single update() call.
     """
-    sha = hashlib.sha256()
     with open(path, 'rb') as f:
-        while True:
-            block = f.read(CHUNK_SIZE)
-            if not block:
-                break
-            sha.update(block)
-    return sha.hexdigest()
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha = hashlib.sha256()
+        if os.fstat(f.fileno()).st_size:  # an empty file can't be mapped (and hashes as b"")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                sha.update(mm)
+        return sha.hexdigest()
+
+
+# errno values meaning "these descriptors can't be spliced" (rather than a real I/O error)
+_SPLICE_UNSUPPORTED = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+
+
+def _wait_for(fd: int, event: int, timeout=None):
+    """Wait with poll() until fd is ready for 'event' (POLLIN/POLLOUT), or raise TimeoutError."""
+    poller = select.poll()
+    poller.register(fd, event)
+    if not poller.poll(None if timeout is None else timeout * 1000):
+        raise TimeoutError("Timed out while splicing")
+
+
+def _splice_once(src_fd: int, dst_fd: int, count: int, wait_fd: int, wait_event: int, timeout=None) -> int:
+    """
+    One os.splice call. Sockets with a timeout are non-blocking under the hood,
+    so when the kernel says "try again" we wait for the socket with poll().
+    """
+    while True:
+        try:
+            return os.splice(src_fd, dst_fd, count, flags=os.SPLICE_F_MOVE)
+        except BlockingIOError:
+            _wait_for(wait_fd, wait_event, timeout)
+
+
+def _drain_pipe(r: int, dst_fd: int, count: int, timeout=None):
+    """
+    Copy 'count' bytes that are already in the pipe to dst_fd with plain read/write.
+    Used when the destination refuses splice after the bytes have left the socket.
+    """
+    while count > 0:
+        data = memoryview(os.read(r, count))
+        count -= len(data)
+        while data:
+            try:
+                data = data[os.write(dst_fd, data):]
+            except BlockingIOError:
+                _wait_for(dst_fd, select.POLLOUT, timeout)
+
+
+def splice_copy(src_fd: int, dst_fd: int, count: int, timeout=None, on_progress=None) -> int:
+    """
+    Move 'count' bytes from src_fd (a socket) to dst_fd (a socket or file) through a pipe,
+    without the bytes ever being copied into Python ("zero-copy", Linux only).
+    on_progress, if given, is called with the running total of bytes moved.
+    Returns the number of bytes moved: 'count' on success, or less if the kernel does not
+    support splicing these descriptors; the caller then copies the rest the normal way.
+    Raises ConnectionError if the source closes early.
+    """
+    if count <= 0:
+        return 0
+    r, w = os.pipe()
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        try:
+            fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, SPLICE_PIPE_SIZE)
+        except OSError:
+            pass  # Not allowed to grow it (limit too low): the default pipe still works
+    moved = 0
+    try:
+        while moved < count:
+            try:
+                n = _splice_once(src_fd, w, count - moved, src_fd, select.POLLIN, timeout)
+            except OSError as e:
+                if moved == 0 and e.errno in _SPLICE_UNSUPPORTED:
+                    return 0
+                raise
+            if n == 0:
+                raise ConnectionError("Connection closed while splicing")
+            # Drain everything we just put in the pipe into the destination
+            while n > 0:
+                try:
+                    k = _splice_once(r, dst_fd, n, dst_fd, select.POLLOUT, timeout)
+                except OSError as e:
+                    if moved == 0 and e.errno in _SPLICE_UNSUPPORTED:
+                        # The destination refuses splice (e.g. a file opened with O_APPEND), but
+                        # these bytes already left the socket: copy them out of the pipe by hand
+                        # and let the caller carry on the normal way
+                        _drain_pipe(r, dst_fd, n, timeout)
+                        moved = n
+                        if on_progress:
+                            on_progress(moved)
+                        return moved
+                    raise
+                n -= k
+                moved += k
+            if on_progress:
+                on_progress(moved)
+    finally:
+        os.close(r)
+        os.close(w)
+    return moved
@@ -0,0 +1,69 @@
+"""
+tcp_file_client.py
+-------------------
+A command-line sender for files that are already on this computer.
+It speaks the same protocol as the browser front-end (see tcp_file_server.py),
+but without HTTP in between: the file goes straight from disk to the TCP socket.
+
+socket.sendfile() uses sendfile(2) where the OS has it (Linux, macOS), so the
+kernel copies the file into the socket and the bytes never pass through Python.
+Elsewhere it falls back to a normal read/send loop.
+
+Run:
+    python scripts/tcp_file_client.py path/to/file [--host 127.0.0.1] [--port 5001]
+
+Only Python standard library is used.
+"""
+
+import os
+import socket
+import argparse
+
+from shared import DONE_TIMEOUT, tune_socket, send_json, recv_json
+
+
+def send_file(path: str, host: str = "127.0.0.1", port: int = 5001) -> dict:
+    """
+    Send one file to the TCP file server and return the server's final JSON reply
+    (status "DONE" on success, "ERROR" otherwise).
+    """
+    filename = os.path.basename(path)
+    with open(path, "rb") as f:
+        filesize = os.fstat(f.fileno()).st_size
+        with socket.create_connection((host, port), timeout=10) as conn:
+            tune_socket(conn)
+
+            # 1) Header, then wait for the server's OK (or a validation error)
+            send_json(conn, {"filename": filename, "filesize": filesize})
+            resp = recv_json(conn)
+            if resp.get("status") != "OK":
+                return resp
+            print(f"[>] Sending '{filename}' ({filesize} bytes) -> {host}:{port} as '{resp.get('save_as')}'")
+
+            # 2) File bytes, copied disk -> socket by the kernel
+            sent = conn.sendfile(f)
+            if sent != filesize:
+                raise ConnectionError(f"Sent {sent} of {filesize} bytes")
+
+            # 3) Final DONE message (the server may be flushing the file to disk first)
+            conn.settimeout(DONE_TIMEOUT)
+            return recv_json(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a local file to tcp_file_server.py")
+    parser.add_argument("path", help="file to send")
+    parser.add_argument("--host", default="127.0.0.1", help="receiver IP (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=5001, help="receiver port (default 5001)")
+    args = parser.parse_args()
+
+    result = send_file(args.path, args.host, args.port)
+    if result.get("status") == "DONE":
+        print(f"[✓] Saved as '{result.get('saved_as')}' ({result.get('bytes_received')} bytes)")
+    else:
+        print(f"[!] {result.get('message', 'Transfer failed')}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
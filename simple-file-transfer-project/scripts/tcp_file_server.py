@@ -25,56 +25,71 @@ This server:
 - Handles duplicate names by auto-renaming, e.g., "file (1).ext".
 - Applies simple validation (size and extension).
 - Prints progress logs in the console (for demonstration).
-- Supports multiple concurrent clients using threads.
+- Supports multiple concurrent clients using a pool of reusable worker threads.
 
 Run:
     python scripts/tcp_file_server.py
 """
 
 import os
-import json
+import errno
+import shutil
 import socket
 import threading
-from typing import Dict
 
 from shared import (
-    HEADER_LEN_SIZE,
     CHUNK_SIZE,
     MAX_FILE_SIZE_BYTES,
+    SPLICE_AVAILABLE,
     ALLOWED_EXTENSIONS,
-    pack_length,
-    unpack_length,
-    unique_save_path,
+    IDLE_TIMEOUT,
+    ProgressLogger,
+    send_json,
+    recv_json,
+    open_unique_file,
+    splice_copy,
+    tune_socket,
+    WorkerPool,
 )
 
 # Where received files are stored
 RECEIVE_DIR = os.path.join(os.path.dirname(__file__), "received")
 
+# Worker threads started up front and reused for transfer after transfer. When all of them
+# are busy, extra threads are added (see WorkerPool), so an upload doesn't wait for another
+# one to finish; but never more than MAX_WORKERS in total, which bounds the thread count
+# (and stack memory). Past that, new connections wait in a queue for a free worker.
+WORKERS = 32
+MAX_WORKERS = 256
 
-def recv_exactly(conn: socket.socket, n: int) -> bytes:
-    """Receive exactly n bytes from the socket or raise if connection closes early."""
-    buf = b""
-    while len(buf) < n:
-        chunk = conn.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Connection closed while reading")
-        buf += chunk
-    return buf
+# How hard to make sure a received file is really on disk before answering DONE:
+#   "none"      - leave it to the OS to write the data out (fastest; the default)
+#   "fdatasync" - flush the file's data (metadata only when needed, e.g. the file size)
+#   "fsync"     - flush data and all metadata
+# Can also be set with the TRANSFER_DURABILITY env variable.
+DURABILITY = os.environ.get("TRANSFER_DURABILITY", "none").strip().lower()
+if DURABILITY not in ("none", "fdatasync", "fsync"):
+    raise ValueError(f"Unknown TRANSFER_DURABILITY {DURABILITY!r}: use none, fdatasync or fsync")
 
+# Seconds a client may take to send its header. A peer that connects and then says nothing
+# would otherwise hold a worker forever. Once the header is in, the longer IDLE_TIMEOUT
+# applies, so an upload paused for a while in the browser is not cut off.
+HEADER_TIMEOUT = 30
 
-def send_json(conn: socket.socket, data: Dict):
-    """Send JSON data framed by a 8-byte length header."""
-    body = json.dumps(data).encode("utf-8")
-    conn.sendall(pack_length(len(body)))
-    conn.sendall(body)
+# Allowed extensions as a lowercase set: one hash lookup per check instead of scanning a list,
+# and '.PNG' in the settings matches 'photo.png' the same as '.png' does
+_ALLOWED_EXT = frozenset(ext.lower() for ext in ALLOWED_EXTENSIONS)
 
+# Per-thread state: each worker keeps one receive buffer for all the transfers it handles
+_thread_state = threading.local()
 
-def recv_json(conn: socket.socket) -> Dict:
-    """Receive a framed JSON message (8-byte length + body)."""
-    length_bytes = recv_exactly(conn, HEADER_LEN_SIZE)
-    length = unpack_length(length_bytes)
-    body = recv_exactly(conn, length)
-    return json.loads(body.decode("utf-8"))
+
+def receive_buffer() -> memoryview:
+    """Return this thread's reusable CHUNK_SIZE receive buffer (created on first use)."""
+    view = getattr(_thread_state, "view", None)
+    if view is None:
+        view = _thread_state.view = memoryview(bytearray(CHUNK_SIZE))
+    return view
 
 
 def validate_request(filename: str, filesize: int) -> tuple[bool, str]:
@@ -83,12 +98,25 @@ def validate_request(filename: str, filesize: int) -> tuple[bool, str]:
         return False, "Filesize must be non-negative."
     if filesize > MAX_FILE_SIZE_BYTES:
         return False, f"File too large. Limit is {MAX_FILE_SIZE_BYTES} bytes."
+    if not isinstance(filename, str) or not filename:
+        return False, "Invalid filename."
     if os.path.sep in filename or os.path.altsep and os.path.altsep in filename:
         return False, "Invalid filename."
-    if ALLOWED_EXTENSIONS:
+    if _ALLOWED_EXT:
         ext = os.path.splitext(filename)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
+        if ext not in _ALLOWED_EXT:
             return False, f"Extension {ext} not allowed."
+    # Refuse right away if the disk can't hold the file, instead of failing halfway through
+    # the upload (concurrent uploads can still race for the space; fallocate catches that)
+    if filesize:
+        try:
+            free = shutil.disk_usage(RECEIVE_DIR).free
+        except FileNotFoundError:
+            # The folder is only created at startup; put it back if it was deleted since
+            os.makedirs(RECEIVE_DIR, exist_ok=True)
+            free = shutil.disk_usage(RECEIVE_DIR).free
+        if free < filesize:
+            return False, "Not enough free disk space on the server."
     return True, "OK"
 
 
@@ -96,9 +124,12 @@ def handle_client(conn: socket.socket, addr):
     """Handle a single client connection in its own thread."""
     try:
         print(f"[+] Connected from {addr}")
+        tune_socket(conn)
 
         # 1) Read header JSON
+        conn.settimeout(HEADER_TIMEOUT)
         header = recv_json(conn)
+        conn.settimeout(IDLE_TIMEOUT)
         filename = header.get("filename")
         filesize = int(header.get("filesize", -1))
 
@@ -109,31 +140,98 @@ def handle_client(conn: socket.socket, addr):
             print(f"[-] Validation error from {addr}: {msg}")
             return
 
-        # 3) Compute unique save path (duplicate handling)
-        save_path, renamed = unique_save_path(RECEIVE_DIR, filename)
+        # 3) Create a uniquely named file (duplicate handling)
+        try:
+            fd, save_path, renamed = open_unique_file(RECEIVE_DIR, filename)
+        except FileNotFoundError:
+            # Same as in validate_request: recreate a deleted receive folder and try once more
+            os.makedirs(RECEIVE_DIR, exist_ok=True)
+            fd, save_path, renamed = open_unique_file(RECEIVE_DIR, filename)
         save_name_for_client = os.path.basename(save_path)
 
-        # 4) Respond OK and the decided save name
-        send_json(conn, {"status": "OK", "save_as": save_name_for_client, "message": "Ready to receive"})
+        ok_sent = False
+        with os.fdopen(fd, "wb") as f:
+            try:
+                # Reserve the disk space up front: one contiguous allocation instead of
+                # growing the file on every write (and a full disk is reported before any data flows)
+                if filesize and hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(fd, 0, filesize)
+                    except OSError as e:
+                        if e.errno == errno.ENOSPC:
+                            raise
+                        # Can't reserve here (e.g. unsupported for this file): just write without it.
+                        # (Filesystems without native support are mostly handled by the C library,
+                        # which reserves the space by writing a zero into every block instead.)
 
-        # 5) Receive file bytes
-        bytes_remaining = filesize
-        received = 0
+                # 4) Respond OK and the decided save name
+                send_json(conn, {"status": "OK", "save_as": save_name_for_client, "message": "Ready to receive"})
+                ok_sent = True
 
-        print(f"[>] Receiving '{filename}' ({filesize} bytes) from {addr} -> {save_path}")
-        with open(save_path, "wb") as f:
-            while bytes_remaining > 0:
-                chunk = conn.recv(min(CHUNK_SIZE, bytes_remaining))
-                if not chunk:
-                    raise ConnectionError("Connection closed during file transfer")
-                f.write(chunk)
-                received += len(chunk)
-                bytes_remaining -= len(chunk)
+                # 5) Receive file bytes
+                received = 0
+                progress = ProgressLogger("    Progress", filesize)
+                print(f"[>] Receiving '{filename}' ({filesize} bytes) from {addr} -> {save_path}")
 
-                # Print simple progress every ~1MB
-                if received % (1024 * 1024) < CHUNK_SIZE:
-                    pct = (received / filesize) * 100 if filesize else 100
-                    print(f"    Progress: {received}/{filesize} bytes ({pct:.2f}%)")
+                # Linux fast path: splice socket -> pipe -> file, the bytes never enter Python
+                if SPLICE_AVAILABLE:
+                    received = splice_copy(conn.fileno(), fd, filesize, conn.gettimeout(), progress.update)
+                bytes_remaining = filesize - received
+
+                # Portable path (also used when the kernel refuses to splice).
+                # recv_into fills the worker's reusable buffer in place, so we don't
+                # allocate a new bytes object for every chunk (or a new buffer per transfer)
+                view = receive_buffer()
+                # Look the methods up once, not on every pass through the loop
+                recv_into, write, report = conn.recv_into, f.write, progress.update
+                while bytes_remaining > 0:
+                    # The socket has a timeout, so each recv only returns what has already
+                    # arrived (often a few KB). Keep filling until the buffer is full, so the
+                    # file is still written in whole CHUNK_SIZE blocks, one write per block.
+                    want = min(CHUNK_SIZE, bytes_remaining)
+                    filled = 0
+                    while filled < want:
+                        n = recv_into(view[filled:want])
+                        if not n:
+                            raise ConnectionError("Connection closed during file transfer")
+                        filled += n
+                    write(view[:filled])
+                    received += filled
+                    bytes_remaining -= filled
+                    report(received)
+
+                # Optionally wait for the data to reach the disk before reporting DONE
+                if DURABILITY != "none":
+                    f.flush()
+                    if DURABILITY == "fdatasync" and hasattr(os, "fdatasync"):
+                        os.fdatasync(fd)
+                    else:
+                        os.fsync(fd)  # "fsync", or systems without fdatasync (macOS, Windows)
+            except BaseException:
+                # posix_fallocate already gave the file its full announced size: cut it back
+                # to the bytes that really arrived, so a failed or canceled upload leaves a
+                # visibly short file rather than one padded with zeros.
+                # Nothing in here may raise over the exception we are handling.
+                try:
+                    f.flush()
+                except OSError:
+                    pass  # e.g. the disk filled up: the buffered tail is lost either way
+                try:
+                    # The fd position is the end of what really reached the file
+                    os.ftruncate(fd, os.lseek(fd, 0, os.SEEK_CUR))
+                except OSError:
+                    pass
+                # Close the raw file directly: closing f (here or at the end of the with)
+                # would retry a failed flush and raise again
+                f.raw.close()
+                if not ok_sent:
+                    # The client never got an OK (no disk space, or the reply couldn't be sent),
+                    # so no upload started: remove the empty file instead of leaving it behind
+                    try:
+                        os.unlink(save_path)
+                    except OSError:
+                        pass
+                raise
 
         # 6) Final response
         final_msg = "Received successfully"
@@ -165,14 +263,31 @@ def start_server(host: str = "0.0.0.0", port: int = 5001):
     print(f"TCP File Server listening on {host}:{port}")
     print(f"Files will be saved into: {RECEIVE_DIR}")
     print("Press Ctrl+C to stop.")
+    # Create the output folder once here, not on every received file
+    os.makedirs(RECEIVE_DIR, exist_ok=True)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Linux: wake accept() only once the client has sent data (its header). A connection
+        # that stays silent is handed over after about HEADER_TIMEOUT seconds at the earliest
+        if hasattr(socket, "TCP_DEFER_ACCEPT"):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, HEADER_TIMEOUT)
         s.bind((host, port))
-        s.listen(5)
+        # Buffer sizes must be set before listen() so accepted sockets inherit them
+        tune_socket(s)
+        # Let the kernel queue a burst of connections until the accept loop takes them
+        s.listen(socket.SOMAXCONN)
+
+        # Threads are started once and reused, instead of one new thread per connection
+        pool = WorkerPool(handle_client, WORKERS, MAX_WORKERS)
+
         while True:
             conn, addr = s.accept()
-            t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            t.start()
+            try:
+                pool.submit(conn, addr)
+            except Exception as e:
+                # Never let one connection take the whole server down
+                print(f"[!] Could not handle {addr}: {e}")
+                conn.close()
 
 
 if __name__ == "__main__":